@@ -6,7 +6,9 @@ import asyncio
 import json
 import csv
 import io
+from html import escape
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (
@@ -21,7 +23,13 @@ from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 
 # local imports
-from api.models import upsert_user, create_user_if_missing, save_report, get_last_report
+from api.models import (
+    upsert_user, create_user_if_missing, save_report, get_last_report,
+    set_watch, get_watched_users, mark_watch_notified, save_watch_refresh, get_report_history,
+    count_report_history, ensure_indexes, normalize_roll
+)
+from api.render import render_report, use_dates, lookup_redemption
+from api.cache import BoundedCache, cache_stats, total_bytes, CACHE_MEMORY_BUDGET
 
 # --- Load environment variables ---
 load_dotenv()
@@ -30,6 +38,15 @@ SHEET_API_URL = os.getenv("SHEET_API_URL", "")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://bit-reward-point-checker-bot.vercel.app/api/webhook")   
 PORT = int(os.environ.get("PORT", 5000))
 ADMIN_ID = int(os.getenv("ADMIN_ID", "7679681280"))
+CRON_SECRET = os.getenv("CRON_SECRET", "")
+WATCH_CONCURRENCY = int(os.getenv("WATCH_CONCURRENCY", "5"))
+WATCH_DEADLINE_DAYS = int(os.getenv("WATCH_DEADLINE_DAYS", "3"))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", "15"))
+# keep under the function's max duration; vercel.json uses legacy "builds", which can't set maxDuration
+WATCH_TIME_BUDGET = int(os.getenv("WATCH_TIME_BUDGET", "40"))
+WATCH_FETCH_TIMEOUT = int(os.getenv("WATCH_FETCH_TIMEOUT", "8"))
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "500"))
+HISTORY_POINTS = 20
 
 if not BOT_TOKEN:
     # Fail gracefully in serverless logs — don't crash deployment immediately
@@ -263,18 +280,18 @@ DEFAULT_REDEMPTION_DATES = {
 }
 
 # Cache structure
-_dates_cache = None
-_cache_expiry = None
+# Single pinned entry: evicting it would just force a CSV refetch and lose the stale fallback
+_dates_cache = BoundedCache("dates", 1, evictable=False)
 CACHE_DURATION = timedelta(minutes=10)
 
 DETAILS_SHEET_CSV_URL = "https://docs.google.com/spreadsheets/d/1w6OQ5E0Gus-3eaSErrB3TSBof2MxBwkkHz4X5Hcx-2w/export?format=csv&gid=409527497"
 
 async def fetch_live_redemption_dates():
-    global _dates_cache, _cache_expiry
     now = datetime.utcnow()
     
-    if _dates_cache and _cache_expiry and now < _cache_expiry:
-        return _dates_cache
+    cached = _dates_cache.get("redemption")
+    if cached:
+        return cached
         
     try:
         async with aiohttp.ClientSession() as session:
@@ -334,85 +351,31 @@ async def fetch_live_redemption_dates():
                     "ip2": "Not scheduled (-)" if sem == "S1" else DEFAULT_REDEMPTION_DATES[sem]["ip2"]
                 }
                 
-        _dates_cache = new_dates
-        _cache_expiry = now + CACHE_DURATION
+        _dates_cache.set("redemption", new_dates, expires_at=now + CACHE_DURATION)
         print("Successfully updated redemption dates from live Google Sheet CSV.")
-        return _dates_cache
+        return new_dates
         
     except Exception as e:
         print(f"Error fetching live redemption dates: {e}. Using cached/fallback dates.")
-        if _dates_cache:
-            return _dates_cache
+        stale = _dates_cache.peek("redemption")
+        if stale:
+            return stale
         return DEFAULT_REDEMPTION_DATES
 
 async def get_redemption_dates(year):
-    # Convert year to string and clean it
-    yr_str = str(year).strip().upper()
-    
-    # Fetch current dates mapping
-    dates_map = await fetch_live_redemption_dates()
-    
-    # Mapping based on semester / year
-    if yr_str in ["IV", "4", "4TH"]:
-        sem = "S7"
-    elif yr_str in ["III", "3", "3RD"]:
-        sem = "S5"
-    elif yr_str in ["II", "2", "2ND", "II L", "II-L", "2 L", "2-L", "IIL"]:
-        sem = "S3"
-    elif yr_str in ["I", "1", "1ST"]:
-        sem = "S1"
-    else:
-        return None
-        
-    dates = dates_map.get(sem)
-    if not dates:
-        return None
-        
-    return {
-        "sem": sem,
-        "ip1": dates.get("ip1", "Not scheduled (-)"),
-        "ip2": dates.get("ip2", "Not scheduled (-)")
-    }
+    # Fetch current dates mapping; the year lookup table is rebuilt only when it changes
+    use_dates(await fetch_live_redemption_dates())
+    return lookup_redemption(year)
 
 async def format_report(data):
-    # Emojis for status
-    status = data.get('status', '-').strip()
-    status_lower = status.lower()
-    
-    if "pass" in status_lower or "active" in status_lower:
-        status_emoji = "✅"
-    elif "fail" in status_lower or "inactive" in status_lower:
-        status_emoji = "❌"
-    elif "warn" in status_lower or "suspend" in status_lower:
-        status_emoji = "⚠️"
-    else:
-        status_emoji = "ℹ️"
-    
-    html = (
-        f"💳 <b>𝗥𝗘𝗪𝗔𝗥𝗗 𝗣𝗢𝗜𝗡𝗧𝗦 🚀</b>\n"
-        f"───────────────────\n"
-        f"👤 <b>Student:</b> {data.get('studentName', '-')}\n"
-        f"🆔 <b>Roll No:</b> <code>{data.get('roll', '-')}</code>\n"
-        f"🏢 <b>Dept:</b> {data.get('department', '-')} ({data.get('year', '-')} Year)\n"
-        f"🤝 <b>Mentor:</b> {data.get('mentor', '-')}\n\n"
-        
-        f"📊 <b>𝗣𝗢𝗜𝗡𝗧𝗦 𝗦𝗨𝗠𝗠𝗔𝗥𝗬</b>\n"
-        f" ├ 🌟 <b>Cumulative:</b> <code>{data.get('cumPoints', 0)}</code> pts\n"
-        f" ├ 🛍️ <b>Redeemed:</b> <code>{data.get('redeemed', 0)}</code> pts\n"
-        f" ├ 📈 <b>Class Average:</b> <code>{data.get('yearAvg', 0)}</code> pts\n"
-        f" └ 💰 <b>Balance:</b> <b>{data.get('balance', 0)}</b> pts • {status_emoji} <b>{status}</b>\n\n"
-    )
-    
-    redemption = await get_redemption_dates(data.get('year'))
-    if redemption:
-        html += (
-            f"📅 <b>𝗥𝗘𝗗𝗘𝗠𝗣𝗧𝗜𝗢𝗡 𝗗𝗘𝗔𝗗𝗟𝗜𝗡𝗘𝗦 ({redemption['sem']})</b>\n"
-            f" ├ ⏳ <b>IP 1 Limit:</b> <code>{redemption['ip1']}</code>\n"
-            f" └ ⌛ <b>IP 2 Limit:</b> <code>{redemption['ip2']}</code>\n\n"
-        )
-        
-    html += "───────────────────"
-    return html
+    return render_report(data, await fetch_live_redemption_dates())
+
+async def fetch_student_data(session: aiohttp.ClientSession, roll: str, timeout: int = 15):
+    async with session.get(SHEET_API_URL.rstrip("/"), params={"rollNo": roll}, timeout=timeout) as resp:
+        if resp.status != 200:
+            text = await resp.text()
+            raise RuntimeError(f"Upstream {resp.status}: {text[:200]}")
+        return await resp.json()
 
 async def fetch_and_send_report(chat_id: int, user, roll: str, context: ContextTypes.DEFAULT_TYPE, reply_to_message_id: int = None):
     try:
@@ -430,11 +393,7 @@ async def fetch_and_send_report(chat_id: int, user, roll: str, context: ContextT
 
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.get(SHEET_API_URL.rstrip("/"), params={"rollNo": roll}, timeout=15) as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    raise RuntimeError(f"Upstream {resp.status}: {text[:200]}")
-                data = await resp.json()
+            data = await fetch_student_data(session, roll)
     except Exception as e:
         msg_text = f"❌ Error calling API: {e}"
         if wait_msg:
@@ -518,7 +477,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await last_report(update, context)
         return
 
-    await fetch_and_send_report(update.effective_chat.id, user, text, context, reply_to_message_id=update.message.message_id)
+    await fetch_and_send_report(update.effective_chat.id, user, normalize_roll(text), context, reply_to_message_id=update.message.message_id)
 
 async def last_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -537,6 +496,249 @@ async def last_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text(await format_report(data), parse_mode="HTML", reply_markup=reply_markup)
 
+# ======================== BALANCE HISTORY ========================
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def downsample(rows: list, max_points: int):
+    # evenly spaced picks that always include the first and last snapshot
+    if len(rows) <= max_points:
+        return rows
+    step = (len(rows) - 1) / (max_points - 1)
+    return [rows[round(i * step)] for i in range(max_points)]
+
+def sparkline(values: list):
+    if not values:
+        return ""
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return SPARK_BLOCKS[len(SPARK_BLOCKS) // 2] * len(values)
+    scale = (len(SPARK_BLOCKS) - 1) / (hi - lo)
+    return "".join(SPARK_BLOCKS[int(round((v - lo) * scale))] for v in values)
+
+def format_history(roll: str, rows: list, total: int = None):
+    # rows is capped at HISTORY_LIMIT, so say so when there are older snapshots we didn't load
+    first_at = rows[0]["created_at"].strftime("%b %d, %Y")
+    last_at = rows[-1]["created_at"].strftime("%b %d, %Y")
+    if total is None:
+        shown = f"last {len(rows)} snapshots"
+    elif total > len(rows):
+        shown = f"last {len(rows)} of {total} snapshots"
+    else:
+        shown = f"{len(rows)} snapshots"
+    html = (
+        f"📈 <b>𝗕𝗔𝗟𝗔𝗡𝗖𝗘 𝗛𝗜𝗦𝗧𝗢𝗥𝗬</b>\n"
+        f"───────────────────\n"
+        f"🆔 <b>Roll No:</b> <code>{escape(roll)}</code>\n"
+        f"🗓️ <b>Range:</b> {first_at} → {last_at} ({shown})\n\n"
+    )
+    points = downsample(rows, HISTORY_POINTS)
+    labels = (("cumPoints", "🌟", "Cumulative"), ("redeemed", "🛍️", "Redeemed"), ("balance", "💰", "Balance"))
+    for idx, (field, emoji, label) in enumerate(labels):
+        values = [to_number((r.get("report") or {}).get(field)) for r in points]
+        branch = "└" if idx == len(labels) - 1 else "├"
+        html += (
+            f" {branch} {emoji} <b>{label}:</b> <code>{values[0]:g}</code> → <code>{values[-1]:g}</code>\n"
+            f"    <code>{sparkline(values)}</code>\n"
+        )
+    html += "───────────────────"
+    return html
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if is_bot(user):
+        return
+    roll = normalize_roll(context.args[0]) if context.args else None
+    if not roll:
+        try:
+            from api.db import get_collection
+            users_col = get_collection("users")
+            doc = await asyncio.to_thread(users_col.find_one, {"user_id": int(user.id)}, {"last_roll": 1})
+            roll = doc.get("last_roll") if doc else None
+        except Exception:
+            roll = None
+    if not roll:
+        await update.message.reply_html("❌ Send your roll number first, or use <code>/history 7376221CS259</code>.")
+        return
+    rows = await get_report_history(roll, limit=HISTORY_LIMIT)
+    if not rows:
+        await update.message.reply_text("❌ No saved history for this roll number yet.")
+        return
+    # only count when the limit was hit; otherwise rows already is the whole history
+    total = await count_report_history(roll) if len(rows) >= HISTORY_LIMIT else len(rows)
+    await update.message.reply_html(format_history(roll, rows, total))
+
+# ======================== BALANCE WATCH ========================
+
+WATCH_FIELDS = ("cumPoints", "redeemed", "balance")
+
+def parse_deadline(value: str):
+    try:
+        return datetime.strptime(str(value).strip(), "%d.%m.%Y").date()
+    except (TypeError, ValueError):
+        return None
+
+async def watch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if is_bot(user):
+        return
+    roll = normalize_roll(context.args[0]) if context.args else None
+    if not roll:
+        try:
+            from api.db import get_collection
+            users_col = get_collection("users")
+            doc = await asyncio.to_thread(users_col.find_one, {"user_id": int(user.id)}, {"last_roll": 1})
+            roll = doc.get("last_roll") if doc else None
+        except Exception:
+            roll = None
+    if not roll:
+        await update.message.reply_html("❌ Send your roll number first, or use <code>/watch 7376221CS259</code>.")
+        return
+    if not SHEET_API_URL:
+        await update.message.reply_text("❌ SHEET_API_URL is not configured.")
+        return
+    # Check the roll once up front; the result is also the baseline the cron diffs against
+    try:
+        async with aiohttp.ClientSession() as session:
+            data = await fetch_student_data(session, roll)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error calling API: {e}")
+        return
+    if not data.get("success"):
+        await update.message.reply_text("❌ " + (data.get("error") or "Student not found."))
+        return
+    if not await set_watch(user.id, roll, data["data"]):
+        await update.message.reply_text("⚠️ DB error. Could not enable the balance watch.")
+        return
+    await update.message.reply_html(
+        f"👀 <b>Watching</b> <code>{escape(roll)}</code>\n\n"
+        f"I'll message you when your balance changes and as redemption deadlines approach. Use /unwatch to stop."
+    )
+
+async def unwatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if is_bot(user):
+        return
+    if not await set_watch(user.id, None):
+        await update.message.reply_text("⚠️ DB error. Could not disable the balance watch.")
+        return
+    await update.message.reply_text("🔕 Balance watch turned off.")
+
+async def notify_watcher(doc: dict, roll: str, report: dict):
+    # Returns (messages sent, whether the watch snapshot changed)
+    user_id = doc["user_id"]
+    sent = 0
+    previous = doc.get("watch_report")
+    changed = previous is None or any(previous.get(f) != report.get(f) for f in WATCH_FIELDS)
+    if changed and previous is not None:
+        try:
+            await app_bot.bot.send_message(
+                chat_id=user_id,
+                text=(
+                    f"🔔 <b>Balance update for</b> <code>{escape(roll)}</code>\n"
+                    f" ├ 💰 <b>Balance:</b> <code>{previous.get('balance', 0)}</code> → <b>{report.get('balance', 0)}</b> pts\n"
+                    f" └ 🛍️ <b>Redeemed:</b> <code>{report.get('redeemed', 0)}</code> pts\n\n"
+                    + await format_report(report)
+                ),
+                parse_mode="HTML"
+            )
+            sent += 1
+        except Exception:
+            pass
+
+    redemption = await get_redemption_dates(report.get("year"))
+    if redemption:
+        today = datetime.utcnow().date()
+        notified = doc.get("watch_notified") or []
+        for ip, label in (("ip1", "IP 1"), ("ip2", "IP 2")):
+            deadline = parse_deadline(redemption[ip])
+            if deadline is None:
+                continue
+            days_left = (deadline - today).days
+            key = f"{redemption['sem']}:{ip}:{redemption[ip]}"
+            if not 0 <= days_left <= WATCH_DEADLINE_DAYS or key in notified:
+                continue
+            when = "today" if days_left == 0 else f"in {days_left} day{'s' if days_left != 1 else ''}"
+            try:
+                await app_bot.bot.send_message(
+                    chat_id=user_id,
+                    text=(
+                        f"⏳ <b>{label} redemption closes {when}</b> (<code>{redemption[ip]}</code>)\n"
+                        f"💰 <b>Balance:</b> <b>{report.get('balance', 0)}</b> pts for <code>{escape(roll)}</code>"
+                    ),
+                    parse_mode="HTML"
+                )
+                sent += 1
+            except Exception:
+                continue
+            await mark_watch_notified(user_id, key)
+    return sent, changed
+
+async def refresh_watched_roll(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, roll: str, docs: list):
+    # One upstream fetch per distinct roll, fanned out to everyone watching it.
+    # Returns (messages sent, whether the watch state was saved)
+    user_ids = [d["user_id"] for d in docs]
+    async with semaphore:
+        try:
+            data = await fetch_student_data(session, roll, timeout=WATCH_FETCH_TIMEOUT)
+        except Exception as e:
+            print(f"Watch refresh failed for {roll}: {e}")
+            data = None
+    if not data or not data.get("success"):
+        # still mark them checked so one bad roll can't pin the front of the queue
+        return 0, await save_watch_refresh(roll, None, [], user_ids)
+    report = data["data"]
+    sent = 0
+    changed_ids = []
+    for doc in docs:
+        n, changed = await notify_watcher(doc, roll, report)
+        sent += n
+        if changed:
+            changed_ids.append(doc["user_id"])
+    return sent, await save_watch_refresh(roll, report, changed_ids, user_ids)
+
+async def run_watch_cycle():
+    # Work through watchers in least-recently-checked batches until the time budget runs out;
+    # whoever is left is first in line on the next cron call
+    cycle_start = datetime.utcnow()
+    stop_at = cycle_start + timedelta(seconds=WATCH_TIME_BUDGET)
+    # worst case for one batch: every fetch in every concurrency round hits the timeout
+    batch_worst_case = timedelta(seconds=-(-WATCH_BATCH_SIZE // max(1, WATCH_CONCURRENCY)) * WATCH_FETCH_TIMEOUT)
+    seen = set()
+    sent = 0
+    if not SHEET_API_URL:
+        return {"watched": 0, "sent": 0, "done": True}
+    # warm the dates cache up front so its fetch doesn't land inside a batch
+    await fetch_live_redemption_dates()
+    semaphore = asyncio.Semaphore(max(1, WATCH_CONCURRENCY))
+    async with aiohttp.ClientSession() as session:
+        while True:
+            # the first batch always runs; later ones only if they can finish inside the budget
+            if seen and datetime.utcnow() + batch_worst_case > stop_at:
+                return {"watched": len(seen), "sent": sent, "done": False}
+            users = await get_watched_users(cycle_start, WATCH_BATCH_SIZE, exclude_user_ids=seen)
+            if not users:
+                return {"watched": len(seen), "sent": sent, "done": True}
+            seen.update(doc["user_id"] for doc in users)
+            by_roll = {}
+            for doc in users:
+                by_roll.setdefault(doc["watch_roll"], []).append(doc)
+            results = await asyncio.gather(
+                *(refresh_watched_roll(session, semaphore, roll, docs) for roll, docs in by_roll.items()),
+                return_exceptions=True
+            )
+            sent += sum(r[0] for r in results if isinstance(r, tuple))
+            if not all(isinstance(r, tuple) and r[1] for r in results):
+                # DB writes are failing; stop rather than risk re-notifying on the next call
+                print("Watch cycle aborted: could not save watch state")
+                return {"watched": len(seen), "sent": sent, "done": False}
+
 # Register handlers only if bot is initialized
 if app_bot is not None:
     app_bot.add_handler(CommandHandler("start", start))
@@ -544,6 +746,9 @@ if app_bot is not None:
     app_bot.add_handler(CommandHandler("exportusers", export_users))
     app_bot.add_handler(CommandHandler("broadcast", broadcast))
     app_bot.add_handler(CommandHandler("lastreport", last_report))
+    app_bot.add_handler(CommandHandler("history", history))
+    app_bot.add_handler(CommandHandler("watch", watch))
+    app_bot.add_handler(CommandHandler("unwatch", unwatch))
     app_bot.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
     app_bot.add_handler(CallbackQueryHandler(button_callback))
     # /dbstatus command to diagnose DB connectivity
@@ -561,6 +766,23 @@ if app_bot is not None:
         except Exception as e:
             await update.message.reply_text(f"❌ DB error: {e}")
     app_bot.add_handler(CommandHandler("dbstatus", dbstatus))
+    # /cachestats command to inspect in-process cache memory
+    async def cachestats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if is_bot(update.effective_user) or update.effective_user.id != ADMIN_ID:
+            await update.message.reply_text("❌ You are not authorized.")
+            return
+        msg_text = f"🧠 <b>Cache Stats</b>\n"
+        msg_text += f"💾 <b>Total:</b> <code>{total_bytes() / 1024:.1f}</code> / <code>{CACHE_MEMORY_BUDGET / 1024:.0f}</code> KiB\n"
+        msg_text += f"───────────────────\n"
+        for c in cache_stats():
+            msg_text += (
+                f"<b>{c['name']}</b>\n"
+                f" ├ 📦 Entries: <code>{c['entries']}/{c['max_entries']}</code>\n"
+                f" ├ 💾 Est. size: <code>{c['bytes'] / 1024:.1f}</code> KiB\n"
+                f" └ 🎯 Hits/misses: <code>{c['hits']}/{c['misses']}</code>\n\n"
+            )
+        await update.message.reply_html(msg_text)
+    app_bot.add_handler(CommandHandler("cachestats", cachestats))
     # swallow errors so serverless loop shutdown doesn't bubble up
     async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE):
         try:
@@ -581,6 +803,11 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print("DB connection failed at startup:", e)
         # allow function to still boot (so we can see logs), but return early
+    try:
+        await asyncio.to_thread(ensure_indexes)
+    except Exception as e:
+        # /history still works without the index, just slower
+        print("Index creation failed at startup:", e)
     # initialize telegram bot and set webhook only if token present
     try:
         global APP_BOT_INITIALIZED
@@ -626,6 +853,24 @@ async def telegram_webhook(request: Request):
     await app_bot.process_update(update)
     return {"status": "ok"}
 
+# scheduled balance-watch refresh (Vercel cron sends "Authorization: Bearer <CRON_SECRET>").
+# Nothing calls this on the Railway/Procfile deploy; point an external scheduler at it there.
+@app.get("/api/cron/watch")
+async def cron_watch(request: Request):
+    if not CRON_SECRET or request.headers.get("authorization") != f"Bearer {CRON_SECRET}":
+        return JSONResponse({"status": "unauthorized"}, status_code=401)
+    if app_bot is None:
+        return JSONResponse({"status": "error", "message": "BOT_TOKEN not configured"}, status_code=500)
+    global APP_BOT_INITIALIZED
+    if not APP_BOT_INITIALIZED:
+        try:
+            await app_bot.initialize()
+            APP_BOT_INITIALIZED = True
+        except Exception as e:
+            return JSONResponse({"status": "error", "message": f"Bot init failed: {e}"}, status_code=500)
+    result = await run_watch_cycle()
+    return {"status": "ok", **result}
+
 # convenience GET to verify webhook URL in a browser
 @app.get("/api/webhook")
 async def webhook_info():
@@ -0,0 +1,142 @@
+# api/cache.py
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+
+# Shared across every BoundedCache in the process; serverless instances have tight memory limits
+CACHE_MEMORY_BUDGET = int(os.getenv("CACHE_MEMORY_BUDGET", str(4 * 1024 * 1024)))
+
+# Flat per-entry charge for the OrderedDict slot and the (value, size, expires_at) tuple;
+# the key and value themselves are charged by the cache's sizer
+ENTRY_OVERHEAD = 160
+
+# Marks a field the sheet didn't send, so explicit nulls still render the way they used to
+MISSING = object()
+
+class CompactReport(NamedTuple):
+    # Only the fields format_report and /exportusers read; the rest of the sheet payload is dropped
+    studentName: object = MISSING
+    roll: object = MISSING
+    department: object = MISSING
+    year: object = MISSING
+    mentor: object = MISSING
+    cumPoints: object = MISSING
+    redeemed: object = MISSING
+    yearAvg: object = MISSING
+    balance: object = MISSING
+    status: object = MISSING
+
+    @classmethod
+    def from_report(cls, report):
+        if isinstance(report, cls):
+            return report
+        return cls._make(map(report.get, cls._fields, _MISSING_DEFAULTS))
+
+    def get(self, name: str, default=None):
+        # dict-style access so rendering code works with either form
+        value = getattr(self, name, MISSING)
+        return default if value is MISSING else value
+
+    def to_dict(self):
+        return {k: v for k, v in zip(self._fields, self) if v is not MISSING}
+
+_MISSING_DEFAULTS = (MISSING,) * len(CompactReport._fields)
+
+def estimate_size(obj) -> int:
+    # Rough deep size for the plain values we cache (str/number/tuple/list/dict); only
+    # worth paying for rarely-set entries, hot caches pass a cheaper sizer
+    if obj is MISSING:
+        return 0
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (tuple, list)):
+        return size + sum(estimate_size(v) for v in obj)
+    return size
+
+def estimate_entry_size(key, value) -> int:
+    return estimate_size(key) + estimate_size(value)
+
+_registry = {}
+_total_bytes = 0
+
+class BoundedCache:
+    # evictable=False pins entries: they still show up in /cachestats and the total, but the
+    # budget never drops them. Use it where losing an entry costs more than a recompute.
+    def __init__(self, name: str, max_entries: int, sizer=estimate_entry_size, evictable: bool = True):
+        self.name = name
+        self.max_entries = max_entries
+        self.sizer = sizer
+        self.evictable = evictable
+        self._data = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        _registry[name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or (entry[2] is not None and datetime.utcnow() >= entry[2]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key):
+        # value regardless of expiry and without touching stats; for stale-on-error fallbacks
+        entry = self._data.get(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, expires_at: datetime = None):
+        size = ENTRY_OVERHEAD + self.sizer(key, value)
+        if self.evictable and size > CACHE_MEMORY_BUDGET:
+            return
+        global _total_bytes
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+            _total_bytes -= old[1]
+        self._data[key] = (value, size, expires_at)
+        self.bytes += size
+        _total_bytes += size
+        while len(self._data) > self.max_entries:
+            self.evict_one()
+        if _total_bytes > CACHE_MEMORY_BUDGET:
+            enforce_budget()
+
+    def evict_one(self):
+        global _total_bytes
+        _, (_, size, _) = self._data.popitem(last=False)
+        self.bytes -= size
+        _total_bytes -= size
+
+    def clear(self):
+        global _total_bytes
+        _total_bytes -= self.bytes
+        self._data.clear()
+        self.bytes = 0
+
+def total_bytes() -> int:
+    return _total_bytes
+
+def enforce_budget():
+    # Evict LRU entries from whichever cache holds the most bytes until we're back under budget
+    while _total_bytes > CACHE_MEMORY_BUDGET:
+        candidates = [c for c in _registry.values() if c.evictable and c._data]
+        if not candidates:
+            break
+        max(candidates, key=lambda c: c.bytes).evict_one()
+
+def cache_stats():
+    return [
+        {"name": c.name, "entries": len(c), "max_entries": c.max_entries, "bytes": c.bytes, "hits": c.hits, "misses": c.misses}
+        for c in _registry.values()
+    ]
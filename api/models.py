@@ -1,8 +1,48 @@
 # api/models.py
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 import asyncio
 from api.db import get_collection
+from api.cache import CompactReport
+
+HISTORY_FIELDS = ("cumPoints", "redeemed", "balance")
+
+def normalize_roll(roll_no: str) -> str:
+    return str(roll_no).strip().upper()
+
+# Case-insensitive roll match, so reports saved before rolls were upper-cased still show up.
+# The history index and query must use the same collation for the index to be picked.
+ROLL_COLLATION = {"locale": "en", "strength": 2}
+INDEX_RETRY = timedelta(minutes=10)
+
+_indexes_ready = False
+_index_retry_at = None
+
+def ensure_indexes():
+    # backs the per-roll history query (equality on roll_no, newest first)
+    global _indexes_ready
+    reports_col = get_collection("reports")
+    reports_col.create_index(
+        [("roll_no", 1), ("created_at", -1)],
+        name="roll_no_ci_created_at",
+        collation=ROLL_COLLATION
+    )
+    _indexes_ready = True
+
+def _ensure_indexes_lazily():
+    # Backstop for cold starts where lifespan didn't run or the DB wasn't reachable yet;
+    # a failure is retried at most every INDEX_RETRY, never on every /history call
+    global _index_retry_at
+    if _indexes_ready:
+        return
+    now = datetime.utcnow()
+    if _index_retry_at and now < _index_retry_at:
+        return
+    _index_retry_at = now + INDEX_RETRY
+    try:
+        ensure_indexes()
+    except Exception as e:
+        print("Index creation failed:", e)
 
 async def upsert_user(user_id: int, username: Optional[str], last_seen: datetime, last_report: dict = None):
     query = {"user_id": int(user_id)}
@@ -11,7 +51,7 @@ async def upsert_user(user_id: int, username: Optional[str], last_seen: datetime
         "$inc": {"total_requests": 1}
     }
     if last_report is not None:
-        update["$set"]["last_report"] = last_report
+        update["$set"]["last_report"] = CompactReport.from_report(last_report).to_dict()
     try:
         users_col = get_collection("users")
         await asyncio.to_thread(users_col.update_one, query, update, upsert=True)
@@ -36,6 +76,7 @@ async def create_user_if_missing(user_id: int, username: Optional[str], last_see
         return
 
 async def save_report(user_id: int, roll_no: str, report: dict):
+    roll_no = normalize_roll(roll_no)
     now = datetime.utcnow()
     doc = {
         "user_id": int(user_id),
@@ -51,7 +92,8 @@ async def save_report(user_id: int, roll_no: str, report: dict):
             users_col.update_one,
             {"user_id": int(user_id)},
             {
-                "$set": {"last_report": report, "last_seen": now, "last_roll": roll_no},
+                # users.last_report only keeps what we render/export; the full payload stays in reports
+                "$set": {"last_report": CompactReport.from_report(report).to_dict(), "last_seen": now, "last_roll": roll_no},
                 "$inc": {"total_requests": 1}
             },
             upsert=True
@@ -69,3 +111,114 @@ async def get_last_report(user_id: int):
         return user.get("last_report")
     except Exception:
         return None
+
+async def set_watch(user_id: int, roll_no: Optional[str], report: dict = None):
+    # roll_no=None turns the watch off; report is the baseline the cron diffs against
+    if roll_no is None:
+        update = {
+            "$set": {"watch_roll": None},
+            "$unset": {"watch_report": "", "watch_notified": "", "watch_checked_at": ""}
+        }
+    else:
+        update = {"$set": {
+            "watch_roll": normalize_roll(roll_no),
+            "watch_report": CompactReport.from_report(report).to_dict() if report else None,
+            "watch_checked_at": None
+        }}
+    try:
+        users_col = get_collection("users")
+        await asyncio.to_thread(users_col.update_one, {"user_id": int(user_id)}, update, upsert=True)
+        return True
+    except Exception:
+        return False
+
+async def get_watched_users(checked_before: datetime, limit: int, exclude_user_ids: list = ()):
+    # least recently checked first, so a cycle that runs out of time resumes where it stopped;
+    # exclude_user_ids keeps a cycle from picking anyone twice even if the checked_at write failed
+    query = {"watch_roll": {"$ne": None}, "watch_checked_at": {"$not": {"$gte": checked_before}}}
+    if exclude_user_ids:
+        query["user_id"] = {"$nin": list(exclude_user_ids)}
+    try:
+        users_col = get_collection("users")
+        return await asyncio.to_thread(
+            lambda: list(
+                users_col.find(
+                    query,
+                    {"user_id": 1, "watch_roll": 1, "watch_report": 1, "watch_notified": 1}
+                )
+                .sort("watch_checked_at", 1)
+                .limit(limit)
+            )
+        )
+    except Exception:
+        return []
+
+async def save_watch_refresh(roll_no: str, report: dict, changed_user_ids: list, checked_user_ids: list):
+    # Watch snapshots go to reports (for /history) and watch_report only; last_report and
+    # last_roll stay whatever the user last checked by hand. Returns False if the writes failed.
+    now = datetime.utcnow()
+    try:
+        users_col = get_collection("users")
+        if changed_user_ids:
+            reports_col = get_collection("reports")
+            await asyncio.to_thread(reports_col.insert_one, {
+                "user_id": None,
+                "roll_no": roll_no,
+                "report": report,
+                "created_at": now,
+                "source": "watch"
+            })
+            await asyncio.to_thread(
+                users_col.update_many,
+                {"user_id": {"$in": changed_user_ids}},
+                {"$set": {"watch_report": CompactReport.from_report(report).to_dict()}}
+            )
+        if checked_user_ids:
+            await asyncio.to_thread(
+                users_col.update_many,
+                {"user_id": {"$in": checked_user_ids}},
+                {"$set": {"watch_checked_at": now}}
+            )
+        return True
+    except Exception:
+        return False
+
+async def mark_watch_notified(user_id: int, key: str):
+    try:
+        users_col = get_collection("users")
+        await asyncio.to_thread(
+            users_col.update_one,
+            {"user_id": int(user_id)},
+            {"$addToSet": {"watch_notified": key}}
+        )
+    except Exception:
+        return
+
+async def get_report_history(roll_no: str, limit: int = 500):
+    # newest `limit` snapshots for a roll, oldest first, numeric fields only
+    projection = {"_id": 0, "created_at": 1}
+    projection.update({f"report.{f}": 1 for f in HISTORY_FIELDS})
+    await asyncio.to_thread(_ensure_indexes_lazily)
+    try:
+        reports_col = get_collection("reports")
+        docs = await asyncio.to_thread(
+            lambda: list(
+                reports_col.find({"roll_no": normalize_roll(roll_no)}, projection, collation=ROLL_COLLATION)
+                .sort("created_at", -1)
+                .limit(limit)
+            )
+        )
+    except Exception:
+        return []
+    docs.reverse()
+    return docs
+
+async def count_report_history(roll_no: str):
+    # total snapshots for a roll (manual checks and watch refreshes); counted off the same index
+    try:
+        reports_col = get_collection("reports")
+        return await asyncio.to_thread(
+            reports_col.count_documents, {"roll_no": normalize_roll(roll_no)}, collation=ROLL_COLLATION
+        )
+    except Exception:
+        return None
@@ -0,0 +1,145 @@
+# api/render.py
+import sys
+from typing import Optional
+from api.cache import BoundedCache, CompactReport
+
+RENDER_CACHE_SIZE = 512
+
+REPORT_TEMPLATE = (
+    "💳 <b>𝗥𝗘𝗪𝗔𝗥𝗗 𝗣𝗢𝗜𝗡𝗧𝗦 🚀</b>\n"
+    "───────────────────\n"
+    "👤 <b>Student:</b> {studentName}\n"
+    "🆔 <b>Roll No:</b> <code>{roll}</code>\n"
+    "🏢 <b>Dept:</b> {department} ({year} Year)\n"
+    "🤝 <b>Mentor:</b> {mentor}\n\n"
+
+    "📊 <b>𝗣𝗢𝗜𝗡𝗧𝗦 𝗦𝗨𝗠𝗠𝗔𝗥𝗬</b>\n"
+    " ├ 🌟 <b>Cumulative:</b> <code>{cumPoints}</code> pts\n"
+    " ├ 🛍️ <b>Redeemed:</b> <code>{redeemed}</code> pts\n"
+    " ├ 📈 <b>Class Average:</b> <code>{yearAvg}</code> pts\n"
+    " └ 💰 <b>Balance:</b> <b>{balance}</b> pts • {status_emoji} <b>{status}</b>\n\n"
+).format
+
+DEADLINES_TEMPLATE = (
+    "📅 <b>𝗥𝗘𝗗𝗘𝗠𝗣𝗧𝗜𝗢𝗡 𝗗𝗘𝗔𝗗𝗟𝗜𝗡𝗘𝗦 ({sem})</b>\n"
+    " ├ ⏳ <b>IP 1 Limit:</b> <code>{ip1}</code>\n"
+    " └ ⌛ <b>IP 2 Limit:</b> <code>{ip2}</code>\n\n"
+).format
+
+FOOTER = "───────────────────"
+
+# Year spellings seen in the sheet, per semester column of the redemption-dates mapping
+SEM_YEAR_ALIASES = {
+    "S7": ("IV", "4", "4TH"),
+    "S5": ("III", "3", "3RD"),
+    "S3": ("II", "2", "2ND", "II L", "II-L", "2 L", "2-L", "IIL"),
+    "S1": ("I", "1", "1ST"),
+}
+
+# Checked in order like the old if/elif chain (so "inactive" still matches "active" first)
+STATUS_RULES = (
+    (("pass", "active"), "✅"),
+    (("fail", "inactive"), "❌"),
+    (("warn", "suspend"), "⚠️"),
+)
+
+_year_table = {}
+_year_table_source = None
+dates_version = 0
+
+# The key's sheet values stay alive as long as the entry does, so they're charged too: a
+# fixed cost for the key tuples and each field's object header (type objects are shared),
+# plus the characters of the string fields. sys.getsizeof per field is too slow for a miss.
+_RENDER_KEY_FIXED = (
+    sys.getsizeof(CompactReport()) * 2 + sys.getsizeof((0, 0, 0))
+    + len(CompactReport._fields) * sys.getsizeof("")
+)
+
+def _render_entry_size(key, html: str) -> int:
+    return _RENDER_KEY_FIXED + sum([len(v) for v in key[0] if type(v) is str]) + sys.getsizeof(html)
+
+def _status_entry_size(status: str, emoji: str) -> int:
+    # emoji values are shared constants
+    return sys.getsizeof(status)
+
+_render_cache = BoundedCache("render", RENDER_CACHE_SIZE, sizer=_render_entry_size)
+_status_cache = BoundedCache("status", 64, sizer=_status_entry_size)
+
+def status_emoji(status: str) -> str:
+    emoji = _status_cache.get(status)
+    if emoji is not None:
+        return emoji
+    status_lower = status.lower()
+    emoji = "ℹ️"
+    for needles, candidate in STATUS_RULES:
+        if any(n in status_lower for n in needles):
+            emoji = candidate
+            break
+    _status_cache.set(status, emoji)
+    return emoji
+
+def build_year_table(dates_map: dict) -> dict:
+    table = {}
+    for sem, aliases in SEM_YEAR_ALIASES.items():
+        dates = dates_map.get(sem)
+        if not dates:
+            continue
+        entry = {
+            "sem": sem,
+            "ip1": dates.get("ip1", "Not scheduled (-)"),
+            "ip2": dates.get("ip2", "Not scheduled (-)")
+        }
+        for alias in aliases:
+            table[alias] = entry
+    return table
+
+def use_dates(dates_map: dict) -> int:
+    # Rebuild the year table only when the mapping actually changes; bumping the version
+    # invalidates rendered reports that embedded the old deadlines
+    global _year_table, _year_table_source, dates_version
+    if dates_map is not _year_table_source and dates_map != _year_table_source:
+        _year_table = build_year_table(dates_map)
+        dates_version += 1
+    _year_table_source = dates_map
+    return dates_version
+
+def lookup_redemption(year) -> Optional[dict]:
+    entry = _year_table.get(str(year).strip().upper())
+    return dict(entry) if entry else None
+
+def _render(data) -> str:
+    status = data.get("status", "-").strip()
+    html = REPORT_TEMPLATE(
+        studentName=data.get("studentName", "-"),
+        roll=data.get("roll", "-"),
+        department=data.get("department", "-"),
+        year=data.get("year", "-"),
+        mentor=data.get("mentor", "-"),
+        cumPoints=data.get("cumPoints", 0),
+        redeemed=data.get("redeemed", 0),
+        yearAvg=data.get("yearAvg", 0),
+        balance=data.get("balance", 0),
+        status_emoji=status_emoji(status),
+        status=status,
+    )
+    redemption = _year_table.get(str(data.get("year")).strip().upper())
+    if redemption:
+        html += DEADLINES_TEMPLATE(**redemption)
+    return html + FOOTER
+
+def render_report(data, dates_map: dict) -> str:
+    version = use_dates(dates_map)
+    # the compact record holds exactly the rendered fields, so it doubles as the content key;
+    # field types go in too, since 1520 == 1520.0 and 1 == True but they render differently
+    report = CompactReport.from_report(data)
+    try:
+        key = (report, tuple(map(type, report)), version)
+        html = _render_cache.get(key)
+    except TypeError:
+        # unhashable field value from the sheet; skip the cache
+        return _render(data)
+    if html is None:
+        # render from the original mapping when we have one; dict.get beats the record's getattr
+        html = _render(data)
+        _render_cache.set(key, html)
+    return html
@@ -0,0 +1,43 @@
+# bench/bench_render.py
+# Microbenchmark for the report render path. Run from the repo root:
+#   python -m bench.bench_render
+import itertools
+import timeit
+
+from api import render
+
+DATES = {
+    "S7": {"ip1": "29.08.2026", "ip2": "17.10.2026"},
+    "S5": {"ip1": "29.08.2026", "ip2": "17.10.2026"},
+    "S3": {"ip1": "31.08.2026", "ip2": "23.10.2026"},
+    "S1": {"ip1": "Not scheduled (-)", "ip2": "Not scheduled (-)"}
+}
+
+REPORT = {
+    "studentName": "Test Student",
+    "roll": "7376221CS259",
+    "department": "CSE",
+    "year": "III",
+    "mentor": "Dr. Mentor",
+    "cumPoints": 1520,
+    "redeemed": 400,
+    "yearAvg": 1310.5,
+    "balance": 1120,
+    "status": "Active"
+}
+
+def bench(label, fn, number=100_000):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5))
+    print(f"{label:<28} {seconds / number * 1e6:8.2f} µs/call")
+
+def main():
+    render.use_dates(DATES)
+    bench("uncached render", lambda: render._render(REPORT))
+    bench("cached render (hit)", lambda: render.render_report(REPORT, DATES))
+
+    reports = [dict(REPORT, roll=f"R{i}", balance=i) for i in range(render.RENDER_CACHE_SIZE * 2)]
+    it = itertools.cycle(reports)
+    bench("cached render (miss/evict)", lambda: render.render_report(next(it), DATES), number=len(reports) * 50)
+
+if __name__ == "__main__":
+    main()